@@ -7,15 +7,20 @@ author: Jason R. Carrete
 """
 
 import csv
-from functools import total_ordering
-from itertools import combinations
+from functools import partial, total_ordering
+from itertools import combinations, combinations_with_replacement
 from enum import Enum, auto, unique
-from collections import Counter, namedtuple
-from random import shuffle
+from random import Random, sample
+from multiprocessing import Pool, cpu_count
+from operator import itemgetter
 from optparse import OptionParser
 
 VERSION = '1.2.1'
 LONG_STR = False  # Determines if string representations should be long rather than short
+GAMES_PER_TASK = 250  # Most games a worker process plays per task
+MAX_PLAYERS = 22  # Each game uses 2 cards per player plus 5 community cards and 3 burns
+SHORT_SUITS = '♠♣♥♦'  # Indexed by Suit value
+SHORT_RANKS = '23456789TJQKA'  # Indexed by Rank value - 2
 
 
 def static_vars(**kwargs):
@@ -38,14 +43,7 @@ class Suit(Enum):
         if LONG_STR:
             return self.name.lower()
         else:
-            if self is Suit.SPADES:
-                return '♠'
-            elif self is Suit.CLUBS:
-                return '♣'
-            elif self is Suit.HEARTS:
-                return '♥'
-            elif self is Suit.DIAMONDS:
-                return '♦'
+            return SHORT_SUITS[self.value]
 
 
 @total_ordering
@@ -65,14 +63,6 @@ class Rank(Enum):
     KING = auto()
     ACE = auto()
 
-    def __hash__(self):
-        return 13 * self.value
-
-    def __eq__(self, other):
-        if self.__class__ is other.__class__:
-            return self.value == other.value
-        return NotImplemented
-
     def __lt__(self, other):
         if self.__class__ is other.__class__:
             return self.value < other.value
@@ -82,57 +72,75 @@ class Rank(Enum):
         if LONG_STR:
             return self.name.lower()
         else:
-            if self is Rank.TEN:
-                return 'T'
-            elif self is Rank.JACK:
-                return 'J'
-            elif self is Rank.QUEEN:
-                return 'Q'
-            elif self is Rank.KING:
-                return 'K'
-            elif self is Rank.ACE:
-                return 'A'
-            else:
-                return str(self.value)
+            return SHORT_RANKS[self.value - Rank.TWO.value]
 
 
-@total_ordering
-class Card:
-    @static_vars(card_pool={})
+class Card(int):
+    """
+    A playing card packed into a single int: 4 * (rank - 2) + suit.
+    Cards can be used directly as indices into the 52 entry lookup
+    tables used by :func:`value_hand`, and compare as ints, so they sort
+    by rank first and suit second.
+    """
+
+    __slots__ = ()
+
     def __new__(cls, suit, rank):
-        if (suit, rank) in Card.__new__.card_pool:
-            return Card.__new__.card_pool[(suit, rank)]
-        else:
-            card = super().__new__(cls)
-            card._suit = suit
-            card._rank = rank
-            Card.__new__.card_pool[(suit, rank)] = card
-            return card
+        return super().__new__(cls, 4 * (rank.value - Rank.TWO.value) + suit.value)
+
+    def __getnewargs__(self):
+        return self.suit, self.rank
 
     @property
     def suit(self):
-        return self._suit
+        return Suit(self % 4)
 
     @property
     def rank(self):
-        return self._rank
+        return Rank(self // 4 + Rank.TWO.value)
 
-    def __hash__(self):
-        return self.suit.value * 13 + self.rank.value * 97
+    def __str__(self):
+        return (CARD_STR_LONG if LONG_STR else CARD_STR_SHORT)[self]
 
-    def __eq__(self, other):
-        if self.__class__ is other.__class__:
-            return self.suit is other.suit and self.rank is other.rank
-        return NotImplemented
+    def __repr__(self):
+        return CARD_REPR[self]
 
-    def __lt__(self, other):
-        if self.__class__ is other.__class__:
-            return self.rank < other.rank
-        return NotImplemented
 
-    def __str__(self):
-        fmt_str = "{rank} of {suit}" if LONG_STR else "{rank}{suit}"
-        return fmt_str.format(rank=str(self.rank), suit=str(self.suit))
+DECK = tuple(Card(suit, rank) for rank in Rank for suit in Suit)  # DECK[i] == i
+# String representations of every card, indexed by card. LONG_STR is always False at import
+CARD_STR_SHORT = tuple("{rank}{suit}".format(rank=str(card.rank), suit=str(card.suit)) for card in DECK)
+CARD_STR_LONG = tuple("{rank} of {suit}".format(rank=card.rank.name.lower(), suit=card.suit.name.lower())
+                      for card in DECK)
+CARD_REPR = tuple("Card(Suit.{suit}, Rank.{rank})".format(suit=card.suit.name, rank=card.rank.name) for card in DECK)
+
+PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+
+def card_key(suit, rank):
+    """
+    Encodes a card using the Cactus Kev layout::
+
+        +--------+--------+--------+--------+
+        |xxxbbbbb|bbbbbbbb|cdhsrrrr|xxpppppp|
+        +--------+--------+--------+--------+
+
+    where b is a bit turned on for the rank of the card, cdhs is a bit
+    turned on for the suit of the card, r is the rank of the card
+    (deuce=0, ..., ace=12) and p is the prime number of the rank
+    (deuce=2, ..., ace=41).
+
+    Details on the evaluator http://suffe.cool/poker/evaluator.html
+
+    :param suit: The suit of the card
+    :param rank: The rank of the card
+    :return: The 32-bit key of the card
+    :rtype: int
+    """
+    r = rank.value - Rank.TWO.value
+    return 1 << (16 + r) | 1 << (12 + suit.value) | r << 8 | PRIMES[r]
+
+
+CARD_KEYS = [card_key(card.suit, card.rank) for card in DECK]
 
 
 @static_vars(HIGH=0, PAIR=1000000, TWO_PAIR=2000000, SET=3000000, STRAIGHT=4000000, FLUSH=5000000,
@@ -148,87 +156,250 @@ def value_hand(hand):
     :return: The score of the hand
     :rtype: int
     """
-    assert len(hand) == 5
-    score = 0
-    hand = sorted(hand)
-    suits_in_hand = set(card.suit for card in hand)
-    ranks_in_hand = set(card.rank for card in hand)
-
-    def is_straight():
-        if len(ranks_in_hand) < 5:
-            return False
-        max_rank_value, min_rank_value = hand[-1].rank.value, hand[0].rank.value
-        if {Rank.TWO, Rank.ACE} < ranks_in_hand:
-            max_rank_value, min_rank_value = hand[-2].rank.value, Rank.TWO.value - 1
-        return len(ranks_in_hand) == 5 and max_rank_value - min_rank_value == 4
-
-    # Check pair hands (pair, full house, ...)
-    counter = Counter(card.rank for card in hand)
-    RankCount = namedtuple('RankCount', 'rank, count')
-    rank_counts = [RankCount(e[0], e[1]) for e in counter.most_common()]
-    if rank_counts[0].count == 3 and rank_counts[1].count == 2:  # Full house
-        score = value_hand.FULL\
-            + value_hand.K * rank_counts[0].rank.value\
-            + rank_counts[1].rank.value
-    elif rank_counts[0].count == 2 and rank_counts[1].count == 2:  # Two pair
-        high_pair_value = max(rank_counts[0].rank.value, rank_counts[1].rank.value)
-        low_pair_value = min(rank_counts[0].rank.value, rank_counts[1].rank.value)
-        score = value_hand.TWO_PAIR\
-            + value_hand.K**2 * high_pair_value\
-            + value_hand.K * low_pair_value\
-            + rank_counts[2].rank.value
-    elif rank_counts[0].count == 3 and rank_counts[1].count == 1:  # Three of a kind
-        high_kicker_value = max(rank_counts[1].rank.value, rank_counts[2].rank.value)
-        low_kicker_value = min(rank_counts[1].rank.value, rank_counts[2].rank.value)
-        score = value_hand.SET\
-            + value_hand.K**2 * rank_counts[0].rank.value\
-            + value_hand.K * high_kicker_value\
-            + low_kicker_value
-    elif rank_counts[0].count == 2 and rank_counts[1].count == 1:  # One pair
-        kickers = sorted(ranks_in_hand - {rank_counts[0].rank}, reverse=True)
-        score = value_hand.PAIR\
-            + value_hand.K**3 * rank_counts[0].rank.value\
-            + value_hand.K**2 * kickers[0].value\
-            + value_hand.K * kickers[1].value\
-            + kickers[2].value
-    elif rank_counts[0].count == 4 and rank_counts[1].count == 1:  # Four of a kind
-        score = value_hand.FOUR\
-            + value_hand.K * rank_counts[0].rank.value\
-            + rank_counts[1].rank.value
-    # Check for flush
-    if len(suits_in_hand) == 1:
-        score = max(value_hand.FLUSH, score)
-        # Check for straight_flush
-        if is_straight():
-            score = value_hand.STRAIGHT_FLUSH
-            # Check for royal flush
-            if min(ranks_in_hand) is Rank.TEN:
-                score = value_hand.ROYAL
-            else:
-                score += Rank.FIVE.value if {Rank.TWO, Rank.ACE} < ranks_in_hand else max(ranks_in_hand).value
-        else:
-            score += sum(14**i * hand[i].rank.value for i in range(len(hand)))
-    elif is_straight():  # Check for straight
-        score = value_hand.STRAIGHT\
-                + (Rank.FIVE.value if {Rank.TWO, Rank.ACE} < ranks_in_hand else max(ranks_in_hand).value)
-    elif score < value_hand.PAIR:
-        # High card is best hand
-        score = sum(14**i * hand[i].rank.value for i in range(len(hand)))
-    return score
+    c1, c2, c3, c4, c5 = map(CARD_KEYS.__getitem__, hand)
+    q = (c1 | c2 | c3 | c4 | c5) >> 16
+    if c1 & c2 & c3 & c4 & c5 & 0xF000:
+        return FLUSHES[q]
+    if UNIQUE5[q]:
+        return UNIQUE5[q]
+    product = (c1 & 0xFF) * (c2 & 0xFF) * (c3 & 0xFF) * (c4 & 0xFF) * (c5 & 0xFF)
+    return PAIRED[product]
+
+
+# Bitboard layout: bit 4 * rank_index + suit is set for every card in the hand
+SUIT_MASKS = tuple(0x1111111111111 << suit for suit in range(4))
+RANK_MASKS = tuple(0xF << (4 * rank) for rank in range(13))
+WHEEL = 0b1000000001111  # A-2-3-4-5 as a 13-bit rank mask
+# Rank value of the high card of every straight, keyed by its 13-bit rank mask
+STRAIGHT_HIGH = {0x1F << rank: rank + Rank.SIX.value for rank in range(9)}
+STRAIGHT_HIGH[WHEEL] = Rank.FIVE.value
+STRAIGHTS = frozenset(STRAIGHT_HIGH)
+POWS14 = (1, 14, 196, 2744, 38416)  # Place values of the cards in a high card tiebreaker
+
+
+def popcount(x):
+    return bin(x).count('1')
+
+
+def _value_bitboard(bb):
+    """
+    Scores a 5 card hand represented as a bitboard. Used to fill the
+    lookup tables of :func:`value_hand`.
+
+    :param bb: The bitboard of the hand being scored
+    :return: The score of the hand
+    :rtype: int
+    """
+    ranks = 0
+    rank_values_by_count = ([], [], [], [], [])  # Rank values of each multiplicity, high to low
+    for rank in reversed(range(13)):
+        count = popcount(bb & RANK_MASKS[rank])
+        if count:
+            ranks |= 1 << rank
+            rank_values_by_count[count].append(rank + Rank.TWO.value)
+    singles, pairs, sets, fours = rank_values_by_count[1:]
+    is_flush = any(popcount(bb & suit_mask) == 5 for suit_mask in SUIT_MASKS)
+    is_straight = ranks in STRAIGHTS
+    straight_high = STRAIGHT_HIGH.get(ranks)
+    high_cards = 0
+    if len(singles) == 5:
+        high_cards = POWS14[4] * singles[0]\
+            + POWS14[3] * singles[1]\
+            + POWS14[2] * singles[2]\
+            + POWS14[1] * singles[3]\
+            + POWS14[0] * singles[4]
+
+    if fours:
+        return value_hand.FOUR + value_hand.K * fours[0] + singles[0]
+    if sets and pairs:
+        return value_hand.FULL + value_hand.K * sets[0] + pairs[0]
+    if is_flush and is_straight:
+        if straight_high == Rank.ACE.value:
+            return value_hand.ROYAL
+        return value_hand.STRAIGHT_FLUSH + straight_high
+    if is_flush:
+        return value_hand.FLUSH + high_cards
+    if is_straight:
+        return value_hand.STRAIGHT + straight_high
+    if sets:
+        return value_hand.SET + value_hand.K**2 * sets[0] + value_hand.K * singles[0] + singles[1]
+    if len(pairs) == 2:
+        return value_hand.TWO_PAIR + value_hand.K**2 * pairs[0] + value_hand.K * pairs[1] + singles[0]
+    if pairs:
+        return value_hand.PAIR\
+            + value_hand.K**3 * pairs[0]\
+            + value_hand.K**2 * singles[0]\
+            + value_hand.K * singles[1]\
+            + singles[2]
+    # High card is best hand
+    return high_cards
+
+
+# Lookup tables for value_hand. FLUSHES and UNIQUE5 are indexed by the
+# 13-bit rank mask of a hand with 5 distinct ranks. Every other hand is
+# identified by the product of its rank primes, which PAIRED maps to
+# the score of the hand.
+FLUSHES = [0] * 7937
+UNIQUE5 = [0] * 7937
+for _ranks in combinations(range(13), 5):
+    _mask = sum(1 << rank for rank in _ranks)
+    FLUSHES[_mask] = _value_bitboard(sum(1 << 4 * rank for rank in _ranks))
+    UNIQUE5[_mask] = _value_bitboard(sum(1 << 4 * rank + i % 2 for i, rank in enumerate(_ranks)))
+PAIRED = {}
+for _ranks in combinations_with_replacement(range(13), 5):
+    if 1 < len(set(_ranks)) < 5:
+        _product = 1
+        _bb = 0
+        for _rank in _ranks:
+            _product *= PRIMES[_rank]
+            _bb |= 1 << 4 * _rank + popcount(_bb & RANK_MASKS[_rank])
+        PAIRED[_product] = _value_bitboard(_bb)
+# Best flush or straight flush for a suit holding 5 to 7 cards, indexed
+# by the 13-bit rank mask of that suit
+FLUSH7 = FLUSHES + [0] * (8192 - len(FLUSHES))
+for _num_ranks in (6, 7):
+    for _ranks in combinations(range(13), _num_ranks):
+        _mask = sum(1 << rank for rank in _ranks)
+        FLUSH7[_mask] = max(FLUSH7[_mask & ~(1 << rank)] for rank in _ranks)
+
+
+# Picks out each of the 21 different 5 card hands from 7 cards
+PICK5OF7 = tuple(itemgetter(*idx) for idx in combinations(range(7), 5))
 
 
 def best_five_card_hand(card_list):
-    return max(({'five_card_hand': c, 'value': value_hand(c)} for c in combinations(card_list, 5)),
-               key=lambda x: x['value'])
+    """
+    Finds the best 5 card hand that can be made from the given cards.
+
+    :param card_list: The cards to choose from. Must be at least 5 cards
+    :return: The score of the best hand and the hand itself
+    :rtype: tuple
+    """
+    if len(card_list) == 7:
+        hands = (pick(card_list) for pick in PICK5OF7)
+    else:
+        hands = combinations(card_list, 5)
+    best_value, best_hand = -1, None
+    for hand in hands:
+        value = value_hand(hand)
+        if value > best_value:
+            best_value, best_hand = value, hand
+    return best_value, best_hand
+
+
+# One 4-bit counter per suit; summing these over a list of cards counts its suits
+SUIT_COUNTERS = [1 << 4 * (card % 4) for card in range(52)]
+
+
+@static_vars(cache={})
+def best_hand_value(card_list):
+    """
+    Gives the score of the best 5 card hand that can be made from the
+    given cards. Equivalent to ``best_five_card_hand(card_list)[0]``
+    without going through every combination of 5 cards.
+
+    With at most 7 cards, a suit appearing 5 or more times rules out
+    quads and full houses, so flushes are scored straight from FLUSH7.
+    Any other score only depends on the ranks of the cards and is
+    memoized on the product of their primes; combinations are only
+    evaluated the first time a set of ranks is seen.
+
+    :param card_list: The cards to choose from. Must be 5 to 7 cards
+    :return: The score of the best hand
+    :rtype: int
+    """
+    keys = [CARD_KEYS[c] for c in card_list]
+    # Adding 3 to every counter carries into its high bit iff it counted 5 or more cards
+    flush_suits = (sum(SUIT_COUNTERS[c] for c in card_list) + 0x3333) & 0x8888
+    if flush_suits:
+        suit_bit = 0x1000 << (flush_suits.bit_length() // 4 - 1)
+        ranks = 0
+        for key in keys:
+            if key & suit_bit:
+                ranks |= key
+        return FLUSH7[ranks >> 16]
+    cache_key = 1
+    for key in keys:
+        cache_key *= key & 0xFF
+    best = best_hand_value.cache.get(cache_key)
+    if best is None:
+        unique5, paired = UNIQUE5, PAIRED
+        best = 0
+        for c1, c2, c3, c4, c5 in combinations(keys, 5):
+            value = unique5[(c1 | c2 | c3 | c4 | c5) >> 16]
+            if not value:
+                product = (c1 & 0xFF) * (c2 & 0xFF) * (c3 & 0xFF) * (c4 & 0xFF) * (c5 & 0xFF)
+                value = paired[product]
+            if value > best:
+                best = value
+        best_hand_value.cache[cache_key] = best
+    return best
 
 
 def winning_hands(hole_cards, community):
     best_hands = [
-        {'hole_cards': player_hole_cards, **best_five_card_hand(player_hole_cards + community)}
+        {'hole_cards': player_hole_cards, 'value': best_hand_value(player_hole_cards + community)}
         for player_hole_cards in hole_cards
     ]
-    best_hands.sort(key=lambda hand: hand['value'], reverse=True)
-    return [hand for hand in best_hands if hand['value'] == best_hands[0]['value']]
+    best_value = max((hand['value'] for hand in best_hands), default=None)
+    return [hand for hand in best_hands if hand['value'] == best_value]
+
+
+def deal_games(num_games, num_players, rng=None):
+    """
+    Deals games of texas hold'em. Each game only draws the cards that
+    are actually dealt, burns included, from the deck rather than
+    shuffling all 52 of them.
+
+    :param num_games: The number of games to deal
+    :param num_players: The number of players dealt into each game
+    :param rng: The random.Random instance used to draw cards. Defaults to the shared module instance
+    :return: A generator of (hole_cards, community) pairs, one per game. hole_cards is a list of
+             sorted 2-tuples, one per player, and community is a sorted 5-tuple
+    """
+    draw = rng.sample if rng else sample
+    n = num_players
+    num_cards = 2 * n + 8  # Hole cards, 5 community cards and 3 burns
+    # Hole cards are dealt one at a time around the table
+    first_round, second_round = slice(0, n), slice(n, 2 * n)
+    # Community cards, each street preceded by a burn
+    pick_community = itemgetter(2 * n + 1, 2 * n + 2, 2 * n + 3, 2 * n + 5, 2 * n + 7)
+    for _ in range(num_games):
+        deck = draw(DECK, num_cards)
+        hole_cards = [(a, b) if a < b else (b, a) for a, b in zip(deck[first_round], deck[second_round])]
+        community = tuple(sorted(pick_community(deck)))
+        yield hole_cards, community
+
+
+def play_games(num_games, num_players):
+    """
+    Deals and plays out games of texas hold'em. Meant to be run in a
+    worker process, so each call deals with its own OS-seeded
+    random.Random rather than the shared module instance.
+
+    :param num_games: The number of games to play
+    :param num_players: The number of players dealt into each game
+    :return: A list of (hole_cards, community, winners) tuples, one per game
+    """
+    return [(hole_cards, community, winning_hands(hole_cards, community))
+            for hole_cards, community in deal_games(num_games, num_players, Random())]
+
+
+def split_tasks(num_games, num_jobs):
+    """
+    Splits a run into tasks for a pool of worker processes. Tasks hold
+    at most GAMES_PER_TASK games but are made small enough that every
+    worker gets about 4 of them, so the load stays balanced.
+
+    :param num_games: The number of games to play
+    :param num_jobs: The number of worker processes
+    :return: A list with the number of games in each task
+    """
+    task_size = max(1, min(GAMES_PER_TASK, -(-num_games // (4 * num_jobs))))
+    tasks = [task_size] * (num_games // task_size)
+    if num_games % task_size:
+        tasks.append(num_games % task_size)
+    return tasks
 
 
 def main():
@@ -243,46 +414,50 @@ def main():
     opt_parser.add_option("-l", "--long", action='store_true',
                           default=False, help="Use long-winded string representations for the cards")
     opt_parser.add_option("-o", "--output", metavar="FILE", help="File to output results to")
+    opt_parser.add_option("-j", "--jobs", type='int', metavar="NUM_JOBS",
+                          help="Specifies the number of worker processes [default: number of CPUs]")
     options, _ = opt_parser.parse_args()
+    if not 1 <= options.players <= MAX_PLAYERS:
+        opt_parser.error("NUM_PLAYERS must be between 1 and {}".format(MAX_PLAYERS))
+    if options.simulations < 0:
+        opt_parser.error("NUM_SIMULATIONS must not be negative")
+    if options.jobs is not None and options.jobs < 1:
+        opt_parser.error("NUM_JOBS must be at least 1")
     global LONG_STR
     LONG_STR = options.long
 
-    def play_game():
-        # Construct deck
-        deck = [Card(suit, rank) for suit in Suit for rank in Rank]
-        shuffle(deck)
-        hole_cards = [[] for _ in range(options.players)]
-        # Deal cards to players
-        for _ in range(2):
-            for player in range(options.players):
-                hole_cards[player].append(deck.pop(0))
-        # Deal community cards
-        community = list()
-        deck.pop(0)  # Burn
-        community.append(deck.pop(0))
-        community.append(deck.pop(0))
-        community.append(deck.pop(0))
-        deck.pop(0)  # Burn
-        community.append(deck.pop(0))
-        deck.pop(0)  # Burn
-        community.append(deck.pop(0))
-        # Get winning hands
-        winners = winning_hands(hole_cards, community)
-        # Write result of the game
-        if options.output:
-            with open(options.output, mode='a', encoding='utf-8', newline='\n') as outfile:
-                writer = csv.writer(outfile)
-                row = [",".join(map(str, sorted(hand))) for hand in hole_cards]
-                row.insert(0, ",".join(map(str, sorted(community))))
-                row.insert(0, ";".join((",".join(map(str, sorted(hand['hole_cards']))) for hand in winners)))
-                writer.writerow(row)
-        else:
-            print(list(map(str, community)), end=' - ')
-            print([(str(hand[0]), str(hand[1])) for hand in hole_cards])
-            print("Winners: ", list(list(map(str, sorted(hand['hole_cards']))) for hand in winners))
+    outfile = None
+    if options.output:
+        outfile = open(options.output, mode='a', encoding='utf-8', newline='\n', buffering=1 << 20)
+        writer = csv.writer(outfile)
+
+    card_str = (CARD_STR_LONG if LONG_STR else CARD_STR_SHORT).__getitem__
 
-    for _ in range(options.simulations):
-        play_game()
+    def csv_row(hole_cards, community, winners):
+        return (";".join(",".join(map(card_str, hand['hole_cards'])) for hand in winners),
+                ",".join(map(card_str, community)),
+                *(",".join(map(card_str, hand)) for hand in hole_cards))
+
+    def record_games(games):
+        # Write results of a batch of games
+        if outfile:
+            writer.writerows(csv_row(*game) for game in games)
+        else:
+            for hole_cards, community, winners in games:
+                print(list(map(str, community)), end=' - ')
+                print([(str(hand[0]), str(hand[1])) for hand in hole_cards])
+                print("Winners: ", list(list(map(str, hand['hole_cards'])) for hand in winners))
+
+    # Games are independent so they are played in batches across all cores
+    jobs = options.jobs or cpu_count()
+    tasks = split_tasks(options.simulations, jobs)
+    try:
+        with Pool(max(1, min(jobs, len(tasks)))) as pool:
+            for games in pool.imap_unordered(partial(play_games, num_players=options.players), tasks):
+                record_games(games)
+    finally:
+        if outfile:
+            outfile.close()
 
 
 if __name__ == '__main__':
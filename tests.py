@@ -1,10 +1,42 @@
 #!/usr/bin/env python3
 
+import pickle
 import poker_sim
 from poker_sim import Suit, Rank, Card
 from unittest import TestCase, main
 
 
+class CardTestCase(TestCase):
+    def test_card_index(self):
+        self.assertEqual(Card(Suit.SPADES, Rank.TWO), 0)
+        self.assertEqual(Card(Suit.HEARTS, Rank.FOUR), 10)
+        self.assertEqual(Card(Suit.DIAMONDS, Rank.ACE), 51)
+        self.assertEqual(sorted(Card(suit, rank) for suit in Suit for rank in Rank), list(range(52)))
+        self.assertEqual(list(poker_sim.DECK), list(range(52)))
+
+    def test_str(self):
+        card = Card(Suit.HEARTS, Rank.TEN)
+        self.assertEqual(str(card), 'T♥')
+        poker_sim.LONG_STR = True
+        try:
+            self.assertEqual(str(card), 'ten of hearts')
+        finally:
+            poker_sim.LONG_STR = False
+
+    def test_repr(self):
+        card = Card(Suit.HEARTS, Rank.TEN)
+        self.assertEqual(repr(card), 'Card(Suit.HEARTS, Rank.TEN)')
+
+    def test_pickle(self):
+        card = Card(Suit.CLUBS, Rank.QUEEN)
+        self.assertIs(pickle.loads(pickle.dumps(card)).suit, Suit.CLUBS)
+        self.assertEqual(pickle.loads(pickle.dumps(card)), card)
+
+    def test_hashes_are_distinct(self):
+        self.assertEqual(len({hash(card) for card in poker_sim.DECK}), 52)
+        self.assertEqual(len({hash(rank) for rank in Rank}), 13)
+
+
 class ValueHandTestCase(TestCase):
     def test_high_card_valuation(self):
         hand = [
@@ -138,13 +170,26 @@ class BestHandTestCase(TestCase):
             Card(Suit.HEARTS, Rank.ACE),
             Card(Suit.HEARTS, Rank.EIGHT)
         ]
-        self.assertEqual(set(poker_sim.best_five_card_hand(com + hole_cards)['cards']),
+        self.assertEqual(set(poker_sim.best_five_card_hand(com + hole_cards)[1]),
                          {Card(Suit.SPADES, Rank.ACE),
                          Card(Suit.SPADES, Rank.KING),
                          Card(Suit.HEARTS, Rank.ACE),
                          Card(Suit.HEARTS, Rank.KING),
                          Card(Suit.DIAMONDS, Rank.NINE)})
 
+    def test_best_hand_value(self):
+        cards = [
+            Card(Suit.SPADES, Rank.ACE),
+            Card(Suit.SPADES, Rank.KING),
+            Card(Suit.SPADES, Rank.EIGHT),
+            Card(Suit.HEARTS, Rank.KING),
+            Card(Suit.DIAMONDS, Rank.NINE),
+            Card(Suit.SPADES, Rank.TWO),
+            Card(Suit.SPADES, Rank.THREE)
+        ]
+        self.assertEqual(poker_sim.best_hand_value(cards), poker_sim.best_five_card_hand(cards)[0])
+        self.assertEqual(poker_sim.best_hand_value(cards[:5]), poker_sim.value_hand(cards[:5]))
+
     def test_best_hand_ties(self):
         com = [
             Card(Suit.SPADES, Rank.ACE),
@@ -159,6 +204,48 @@ class BestHandTestCase(TestCase):
         ]
         self.assertEqual(len(poker_sim.winning_hands(hole_cards, com)), 2)
 
+    def test_no_players(self):
+        com = [
+            Card(Suit.SPADES, Rank.ACE),
+            Card(Suit.SPADES, Rank.KING),
+            Card(Suit.SPADES, Rank.QUEEN),
+            Card(Suit.SPADES, Rank.JACK),
+            Card(Suit.SPADES, Rank.TEN)
+        ]
+        self.assertEqual(poker_sim.winning_hands([], com), [])
+
+
+class DealGamesTestCase(TestCase):
+    def test_deal_games(self):
+        games = list(poker_sim.deal_games(10, 9))
+        self.assertEqual(len(games), 10)
+        for hole_cards, community in games:
+            self.assertEqual(len(hole_cards), 9)
+            self.assertTrue(all(len(hand) == 2 for hand in hole_cards))
+            self.assertEqual(len(community), 5)
+            self.assertEqual(list(community), sorted(community))
+            self.assertTrue(all(list(hand) == sorted(hand) for hand in hole_cards))
+            dealt = list(community) + [card for hand in hole_cards for card in hand]
+            self.assertEqual(len(set(dealt)), len(dealt))
+
+    def test_split_tasks(self):
+        self.assertEqual(poker_sim.split_tasks(1000, 8), [32] * 31 + [8])
+        self.assertEqual(poker_sim.split_tasks(100000, 2), [poker_sim.GAMES_PER_TASK] * 400)
+        self.assertEqual(poker_sim.split_tasks(3, 4), [1, 1, 1])
+        self.assertEqual(poker_sim.split_tasks(0, 4), [])
+
+    def test_play_games(self):
+        games = poker_sim.play_games(200, 4)
+        self.assertEqual(len(games), 200)
+        for hole_cards, community, winners in games:
+            values = [poker_sim.best_five_card_hand(hand + community)[0] for hand in hole_cards]
+            self.assertTrue(winners)
+            for winner in winners:
+                self.assertIn(winner['hole_cards'], hole_cards)
+                self.assertEqual(winner['value'], poker_sim.best_five_card_hand(winner['hole_cards'] + community)[0])
+                self.assertEqual(winner['value'], max(values))
+            self.assertEqual(len(winners), values.count(max(values)))
+
 
 if __name__ == '__main__':
     main()